@@ -0,0 +1,88 @@
+"""
+Memory/time benchmark for the compact member table.
+Usage: python bench_member_table.py [members]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from guild_state import compile_guild_state
+from member_table import MemberTable, RoleIndex, plan_nicknames
+
+
+def make_members(count, role_ids):
+    """
+    Stand-ins for cached discord.py members (id, _roles, display_name).
+    Every member gets a unique display name, as in a real guild.
+    """
+    rng = random.Random(0)
+    for i in range(count):
+        yield SimpleNamespace(
+            id=10**17 + i,
+            _roles=rng.sample(role_ids, rng.randint(0, 4)),
+            display_name=f"user{i:06d}_{rng.getrandbits(32):08x}",
+        )
+
+
+def make_payloads(members):
+    for member in members:
+        yield {
+            "user": {"id": str(member.id), "username": member.display_name},
+            "nick": None,
+            "roles": [str(r) for r in member._roles],
+        }
+
+
+def table_memory(build):
+    """
+    Returns (table, bytes) for the table's own allocations plus the
+    display-name strings it keeps alive.
+    """
+    tracemalloc.start()
+    table = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Names may be shared with the source objects (created before tracing), count them explicitly
+    names = {id(name): name for name in table.names}
+    current += sum(sys.getsizeof(name) for name in names.values())
+    return table, current
+
+
+def report(label, count, build):
+    start = time.perf_counter()
+    build()
+    build_time = time.perf_counter() - start
+
+    # Separate traced build so tracemalloc overhead doesn't skew the timing
+    table, used = table_memory(build)
+    per_100k = used * 100_000 / count
+    print(f"{label}: {len(table)} members, build {build_time:.3f}s, "
+          f"memory {used / 1024 / 1024:.2f} MiB ({per_100k / 1024 / 1024:.2f} MiB per 100k incl. names)")
+    return table
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    role_ids = list(range(1, 51))
+    positions = {role_id: role_id for role_id in role_ids}
+    state = compile_guild_state({
+        "default_tag": "[Member]",
+        "roles": {str(role_id): f"[R{role_id}]" for role_id in role_ids[::5]},
+    })
+    index = RoleIndex(state["roles"], positions)
+
+    members = list(make_members(count, role_ids))
+    payloads = list(make_payloads(members))
+
+    table = report("from_members", count, lambda: MemberTable.from_members(index, members))
+    report("from_payloads", count, lambda: MemberTable.from_payloads(index, payloads))
+
+    start = time.perf_counter()
+    planned = sum(1 for _ in plan_nicknames(table, state["default_tag"], state["known_tags"]))
+    print(f"plan: {time.perf_counter() - start:.3f}s ({planned} edits)")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,17 @@ from discord.ext import commands
 import os
 import json
 import asyncio
+import io
+import signal
+import time
 from dotenv import load_dotenv
 from keep_alive import keep_alive
+from loop_monitor import LoopWatchdog, profile_loop
+from guild_state import GuildStateCache
+from member_table import MAX_NICK_LENGTH, MemberTable, RoleIndex, calculate_nickname, plan_member, plan_nicknames, reconcile
+
+# Used for the time-to-ready / time-to-first-edit startup metrics
+STARTUP_TIME = time.monotonic()
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
@@ -29,6 +38,19 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 
 CONFIG_FILE = 'role_tags.json'
 
+# Compiled per-guild state, warm-started from the last snapshot
+state_cache = GuildStateCache(CONFIG_FILE)
+print(f"Startup Check: Warm-started state for {state_cache.load_snapshot()} guilds from snapshot")
+
+# Event loop lag watchdog (started in on_ready)
+loop_watchdog = LoopWatchdog()
+
+# Upper bound for !profile so a typo can't keep the sampler running for hours
+MAX_PROFILE_SECONDS = 120
+
+# How often the compiled guild state is written to disk (seconds)
+SNAPSHOT_INTERVAL = int(os.getenv('STATE_SNAPSHOT_INTERVAL', '300'))
+
 def load_config():
     if not os.path.exists(CONFIG_FILE):
         return {}
@@ -41,6 +63,7 @@ def load_config():
 def save_config(config):
     with open(CONFIG_FILE, 'w') as f:
         json.dump(config, f, indent=4)
+    state_cache.invalidate()
 
 def get_guild_config(guild_id):
     """
@@ -80,6 +103,38 @@ def update_guild_config(guild_id, key, value):
         
     save_config(config)
 
+startup_metrics = {"first_edit_logged": False}
+
+# Periodic snapshot writer (started once in on_ready)
+snapshot_task = None
+
+def get_guild_state(guild_id):
+    """
+    Returns the compiled state for a guild ('default_tag', 'roles', 'known_tags').
+    Served from memory; recompiled only when the config file changes.
+    """
+    return state_cache.get(guild_id)
+
+def write_state_snapshot():
+    """
+    Writes the state snapshot if anything was compiled or invalidated since the last write.
+    """
+    try:
+        state_cache.save_snapshot()
+    except OSError as e:
+        print(f"[ERROR] Failed to write state snapshot: {e}")
+
+def log_first_edit():
+    if startup_metrics["first_edit_logged"]:
+        return
+    startup_metrics["first_edit_logged"] = True
+    print(f"[METRIC] time_to_first_enforced_edit: {time.monotonic() - STARTUP_TIME:.2f}s")
+
+async def snapshot_loop():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        write_state_snapshot()
+
 def remove_guild_role_config(guild_id, role_id):
     config = load_config()
     guild_id_str = str(guild_id)
@@ -97,6 +152,15 @@ async def on_ready():
     print(f'Bot ID: {bot.user.id}')
     print(f'Connected to {len(bot.guilds)} guilds')
     print('--- Ready ---')
+    print(f"[METRIC] time_to_ready: {time.monotonic() - STARTUP_TIME:.2f}s")
+    loop_watchdog.start()
+
+    # Compile state for every guild now so the first snapshot is complete
+    for guild in bot.guilds:
+        get_guild_state(guild.id)
+    global snapshot_task
+    if snapshot_task is None:
+        snapshot_task = asyncio.create_task(snapshot_loop())
 
 @bot.command(name='settings')
 @commands.has_permissions(manage_nicknames=True)
@@ -141,6 +205,29 @@ async def ping(ctx):
     """
     await ctx.send(f'Pong! 🏓 Latency: {round(bot.latency * 1000)}ms')
 
+@bot.command(name='profile')
+@commands.has_permissions(administrator=True)
+async def profile(ctx, seconds: int = 10):
+    """
+    Samples the event loop for a few seconds and uploads a collapsed-stack file
+    (open it with flamegraph.pl or https://www.speedscope.app).
+    Usage: !profile [seconds]
+    """
+    seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+    await ctx.send(f"Profiling the event loop for **{seconds}s**...")
+
+    profiler = await profile_loop(seconds)
+    if not profiler.total:
+        await ctx.send("No samples were collected.")
+        return
+
+    data = io.BytesIO(profiler.collapsed().encode('utf-8'))
+    await ctx.send(
+        f"**Profile Complete**\nSamples: {profiler.total}\n"
+        f"Loop lag: last {int(loop_watchdog.last_lag * 1000)}ms, max {int(loop_watchdog.max_lag * 1000)}ms, stalls {loop_watchdog.stalls}",
+        file=discord.File(data, filename='profile.collapsed')
+    )
+
 @bot.command(name='autonick')
 @commands.has_permissions(manage_nicknames=True)
 async def set_auto_nick(ctx, role: discord.Role, tag: str):
@@ -221,12 +308,13 @@ async def update_all_users(ctx, role: discord.Role = None):
     If NO role is provided, updates ALL members in the server (Use with caution).
     Usage: !updateall [@Role]
     """
-    guild_config = get_guild_config(ctx.guild.id)
+    guild_state = get_guild_state(ctx.guild.id)
+    roles_config = guild_state["roles"]
     
     members_to_update = []
     if role:
         role_id = str(role.id)
-        if role_id not in guild_config.get("roles", {}):
+        if role_id not in roles_config:
             await ctx.send(f"Warning: Role **{role.name}** is not configured, but I will still enforce hierarchy/defaults for its members.")
         members_to_update = role.members
         await ctx.send(f"Starting batch update for **{len(members_to_update)}** users with role **{role.name}**...")
@@ -236,69 +324,34 @@ async def update_all_users(ctx, role: discord.Role = None):
 
     count = 0
     errors = 0
-    
-    # Pre-calculate known tags
-    all_config_tags = list(guild_config.get("roles", {}).values())
-    legacy_default_tags = ["[𝙼𝚂𝚄𝚊𝚗]", "[MSUAN]", "[Msuan]", "[msuan]"]
-    default_tag = guild_config.get('default_tag')
-    
-    all_known_tags = list(set(all_config_tags + legacy_default_tags))
-    if default_tag and default_tag not in all_known_tags:
-        all_known_tags.append(default_tag)
-        
-    all_known_tags.sort(key=len, reverse=True)
 
-    for member in members_to_update:
+    # --- 1. Build the compact member table (ids, role bitsets, names) ---
+    role_index = RoleIndex.from_guild(ctx.guild, roles_config)
+    table = MemberTable.from_members(role_index, members_to_update)
+
+    # --- 2. Plan nicknames and drop edits we are not allowed to make ---
+    default_tag = guild_state["default_tag"]
+    all_known_tags = guild_state["known_tags"]
+    plan = plan_nicknames(table, default_tag, all_known_tags)
+    edits = reconcile(table, plan, ctx.guild.owner_id, ctx.guild.me.top_role.position)
+
+    # --- 3. Apply ---
+    for row, final_nick in edits:
+        member = ctx.guild.get_member(table.ids[row])
+        if member is None:
+            continue
+        if not table.matches(row, member):
+            # Renamed or retagged since the sweep started: plan again from the live member
+            final_nick = plan_member(role_index, member, default_tag, all_known_tags)
+            if final_nick is None:
+                continue
+            if member.top_role >= ctx.guild.me.top_role:
+                continue
         try:
-            # --- 1. Determine Target Tag (Hierarchy Check) ---
-            user_configured_roles = [r for r in member.roles if str(r.id) in guild_config.get("roles", {})]
-            user_configured_roles.sort(key=lambda r: r.position, reverse=True)
-            
-            target_tag = None
-            if user_configured_roles:
-                target_tag = guild_config["roles"][str(user_configured_roles[0].id)]
-            else:
-                target_tag = default_tag
-            
-            # --- 2. Clean Nickname ---
-            current_nick = member.display_name
-            temp_nick = current_nick
-            
-            for t in all_known_tags:
-                if t in temp_nick:
-                    new_val = temp_nick.replace(f" {t}", "")
-                    if new_val == temp_nick:
-                        new_val = temp_nick.replace(t, "")
-                    temp_nick = new_val.strip()
-            
-            # --- 3. Append Target Tag ---
-            if target_tag:
-                final_nick = f"{temp_nick} {target_tag}"
-            else:
-                final_nick = temp_nick
-                
-            # --- 4. Length Check ---
-            if len(final_nick) > 32:
-                if target_tag:
-                    allowed = 32 - len(target_tag) - 1
-                    if allowed > 0:
-                        final_nick = f"{temp_nick[:allowed].strip()} {target_tag}"
-                    else:
-                        final_nick = temp_nick[:32]
-                else:
-                    final_nick = temp_nick[:32]
-            
-            # --- 5. Apply ---
-            if final_nick != current_nick:
-                if member.id == ctx.guild.owner_id:
-                    continue
-                if member.top_role >= ctx.guild.me.top_role:
-                    continue
-                    
-                await member.edit(nick=final_nick)
-                count += 1
-                print(f"Batch updated: {member.name} -> {final_nick}")
-                
+            await member.edit(nick=final_nick)
+            count += 1
+            log_first_edit()
+            print(f"Batch updated: {member.name} -> {final_nick}")
         except Exception as e:
             print(f"Failed to update {member.name}: {e}")
             errors += 1
@@ -402,8 +455,7 @@ async def on_member_join(member):
     Triggered when a new member joins the server.
     Applies the default tag if configured.
     """
-    guild_config = get_guild_config(member.guild.id)
-    default_tag = guild_config.get('default_tag')
+    default_tag = get_guild_state(member.guild.id)["default_tag"]
     
     # If no default tag is configured for this server, do nothing
     if not default_tag:
@@ -422,15 +474,16 @@ async def on_member_join(member):
     final_nick = f"{current_nick} {default_tag}"
     
     # Length check
-    if len(final_nick) > 32:
-        allowed = 32 - len(default_tag) - 1
+    if len(final_nick) > MAX_NICK_LENGTH:
+        allowed = MAX_NICK_LENGTH - len(default_tag) - 1
         if allowed > 0:
             final_nick = f"{current_nick[:allowed].strip()} {default_tag}"
         else:
-            final_nick = current_nick[:32]
+            final_nick = current_nick[:MAX_NICK_LENGTH]
             
     try:
         await member.edit(nick=final_nick)
+        log_first_edit()
         print(f"Join Update: {member.name} -> {final_nick}")
     except Exception as e:
         print(f"Failed to update new member {member.name}: {e}")
@@ -466,83 +519,40 @@ async def on_member_update(before, after):
 
         print(f"[DEBUG] Member Update Processing: {after.name}")
 
-        guild_config = get_guild_config(after.guild.id)
+        guild_state = get_guild_state(after.guild.id)
+        roles_config = guild_state["roles"]
         current_nick = after.display_name
         
         # --- 1. Determine the Target Tag based on Hierarchy ---
         # Find all roles the user has that are in our config
-        user_configured_roles = [r for r in after.roles if str(r.id) in guild_config.get("roles", {})]
+        user_configured_roles = [r for r in after.roles if str(r.id) in roles_config]
         
         # Sort by position descending (Highest role first)
         user_configured_roles.sort(key=lambda r: r.position, reverse=True)
         
         # Determine the default tag (fallback)
-        default_tag = guild_config.get('default_tag')
+        default_tag = guild_state["default_tag"]
 
         target_tag = None
         if user_configured_roles:
             # User has configured roles, pick the highest one
             highest_role = user_configured_roles[0]
-            target_tag = guild_config["roles"][str(highest_role.id)]
+            target_tag = roles_config[str(highest_role.id)]
         else:
             # User has no configured roles, revert to default
             target_tag = default_tag
 
         # If neither role tag nor default tag is configured, we might want to strip any OLD tags
         # But if there's absolutely no config for this guild, we should probably do nothing
-        if not target_tag and not guild_config.get("roles"):
+        if not target_tag and not roles_config:
              return
 
         # --- 2. Calculate New Nickname ---
-        
-        # List of all tags we know about (Configured + Defaults + Legacy)
-        all_config_tags = list(guild_config.get("roles", {}).values())
-        legacy_default_tags = ["[𝙼𝚂𝚄𝚊𝚗]", "[MSUAN]", "[Msuan]", "[msuan]"]
-        
-        # Use a set to avoid duplicates, but convert to list for sorting
-        all_known_tags = list(set(all_config_tags + legacy_default_tags))
-        if default_tag and default_tag not in all_known_tags:
-            all_known_tags.append(default_tag)
-        
-        # We want to remove ANY known tag that is NOT our target_tag
-        # (And also remove the target_tag temporarily to ensure it's placed correctly at the end)
-        
-        temp_nick = current_nick
-        
-        # Remove ALL known tags first to get the "clean" name
-        # Sort by length descending to avoid partial replacements
-        all_known_tags.sort(key=len, reverse=True)
-        
-        for tag in all_known_tags:
-            if tag in temp_nick:
-                # Try removing " {tag}" (with space)
-                new_val = temp_nick.replace(f" {tag}", "")
-                if new_val == temp_nick:
-                    # Try removing "{tag}" (no space)
-                    new_val = temp_nick.replace(tag, "")
-                temp_nick = new_val.strip()
-                
-        # Now temp_nick should be just the username without any known tags
-        
-        # --- 3. Append Target Tag ---
-        if target_tag:
-            final_nick = f"{temp_nick} {target_tag}"
-        else:
-            final_nick = temp_nick
-
-        # --- 4. Length Check (32 chars max) ---
-        if len(final_nick) > 32:
-            if target_tag:
-                # Truncate name to fit tag
-                allowed_len = 32 - len(target_tag) - 1 # -1 for space
-                if allowed_len > 0:
-                    final_nick = f"{temp_nick[:allowed_len].strip()} {target_tag}"
-                else:
-                    final_nick = temp_nick[:32] # Fallback
-            else:
-                final_nick = temp_nick[:32]
-
-        # --- 5. Apply Changes ---
+        # Strip every known tag (Configured + Defaults + Legacy), append the
+        # target tag and fit the result into MAX_NICK_LENGTH characters
+        final_nick = calculate_nickname(current_nick, target_tag, guild_state["known_tags"])
+
+        # --- 3. Apply Changes ---
         if final_nick != current_nick:
             # Permission/Hierarchy Checks
             if after.id == after.guild.owner_id:
@@ -553,6 +563,7 @@ async def on_member_update(before, after):
 
             try:
                 await after.edit(nick=final_nick)
+                log_first_edit()
                 print(f"[SUCCESS] Update: {after.name} -> {final_nick}")
             except discord.Forbidden:
                  print(f"[ERROR] Permission Denied: Cannot update {after.name}.")
@@ -568,7 +579,8 @@ async def on_command_error(ctx, error):
     Handles command errors, specifically missing permissions.
     """
     if isinstance(error, commands.MissingPermissions):
-        await ctx.send(f"⛔ **Access Denied**: You need the **Manage Nicknames** permission to use this command.")
+        missing = ", ".join(p.replace('_', ' ').title() for p in error.missing_permissions)
+        await ctx.send(f"⛔ **Access Denied**: You need the **{missing}** permission to use this command.")
     elif isinstance(error, commands.MissingRequiredArgument):
         await ctx.send(f"⚠️ **Missing Argument**: {error}")
     elif isinstance(error, commands.BadArgument):
@@ -578,6 +590,19 @@ async def on_command_error(ctx, error):
         # Optionally send generic error to chat?
         # await ctx.send(f"An error occurred: {error}")
 
+@bot.event
+async def setup_hook():
+    """
+    Render/Heroku stop the process with SIGTERM. Close the bot from inside the
+    event loop so bot.run() returns normally and the snapshot is written after it.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(bot.close()))
+    except NotImplementedError:
+        # Windows event loops don't support signal handlers
+        pass
+
 if __name__ == "__main__":
     if not TOKEN:
         print("Error: DISCORD_TOKEN not found in environment variables.")
@@ -585,6 +610,7 @@ if __name__ == "__main__":
         keep_alive()  # Start the web server
         try:
             bot.run(TOKEN)
+            write_state_snapshot()
         except discord.errors.PrivilegedIntentsRequired:
             print("CRITICAL ERROR: Privileged Intents not enabled!")
             print("1. Go to Discord Developer Portal (https://discord.com/developers/applications)")
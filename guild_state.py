@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import time
+
+SNAPSHOT_FILE = os.getenv('STATE_SNAPSHOT_FILE', 'state_snapshot.json')
+SNAPSHOT_FORMAT = 1
+
+# Old default tags that should always be stripped when re-tagging a member
+LEGACY_DEFAULT_TAGS = ["[𝙼𝚂𝚄𝚊𝚗]", "[MSUAN]", "[Msuan]", "[msuan]"]
+
+
+def config_stat(config_file):
+    """
+    Returns a cheap change marker for the config file (mtime + size),
+    or None if the file does not exist.
+    """
+    try:
+        st = os.stat(config_file)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def config_version(config_file):
+    """
+    Returns a content hash of the config file, or None if it does not exist.
+    Unlike config_stat this survives a redeploy that rewrites the file unchanged.
+    """
+    try:
+        with open(config_file, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def compile_guild_state(guild_config):
+    """
+    Pre-computes everything the nickname logic needs for one guild,
+    so events don't rebuild the known-tag list every time.
+    """
+    roles = dict(guild_config.get("roles", {}))
+    default_tag = guild_config.get("default_tag")
+
+    known_tags = list(set(list(roles.values()) + LEGACY_DEFAULT_TAGS))
+    if default_tag and default_tag not in known_tags:
+        known_tags.append(default_tag)
+    # Longest first to avoid partial replacements
+    known_tags.sort(key=len, reverse=True)
+
+    return {
+        "default_tag": default_tag,
+        "roles": roles,
+        "known_tags": known_tags,
+    }
+
+
+def code_version():
+    """
+    Returns a hash of the code that shapes a compiled state (the legacy tag list
+    and compile_guild_state), so a redeploy that changes either one discards
+    old snapshots even when role_tags.json is unchanged.
+    """
+    code = compile_guild_state.__code__
+    digest = hashlib.sha1()
+    digest.update(json.dumps(LEGACY_DEFAULT_TAGS).encode('utf-8'))
+    digest.update(code.co_code)
+    digest.update(repr(code.co_consts).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def save_snapshot(states, version, path=SNAPSHOT_FILE):
+    """
+    Writes the compiled guild states to disk atomically.
+    """
+    data = {
+        "format": SNAPSHOT_FORMAT,
+        "code_version": code_version(),
+        "config_version": version,
+        "written_at": time.time(),
+        "guilds": states,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(version, path=SNAPSHOT_FILE):
+    """
+    Loads compiled guild states from disk.
+    Returns an empty dict if the snapshot is missing, unreadable, or was
+    written for a different config or code version.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+    if data.get("format") != SNAPSHOT_FORMAT or data.get("config_version") != version:
+        return {}
+    if data.get("code_version") != code_version():
+        return {}
+    return data.get("guilds", {})
+
+
+class GuildStateCache:
+    """
+    In-memory cache of compiled guild states for one config file.
+
+    A stat() per lookup detects external edits; the content hash is only
+    recomputed when the stat changes, and states are dropped only when the
+    content actually differs. Writes made by the bot itself call invalidate().
+    `dirty` is set whenever the states differ from the last snapshot on disk.
+    """
+
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self.stat = config_stat(config_file)
+        self.version = config_version(config_file)
+        self.guilds = {}
+        self.dirty = False
+
+    def _load_guild_config(self, guild_id_str):
+        try:
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            config = {}
+        return config.get(guild_id_str, {"default_tag": None, "roles": {}})
+
+    def _check_version(self):
+        stat = config_stat(self.config_file)
+        if stat == self.stat:
+            return
+        self.stat = stat
+        version = config_version(self.config_file)
+        if version != self.version:
+            self.version = version
+            self.guilds.clear()
+            self.dirty = True
+
+    def get(self, guild_id):
+        """
+        Returns the compiled state for a guild ('default_tag', 'roles', 'known_tags').
+        """
+        self._check_version()
+        guild_id_str = str(guild_id)
+        state = self.guilds.get(guild_id_str)
+        if state is None:
+            state = compile_guild_state(self._load_guild_config(guild_id_str))
+            self.guilds[guild_id_str] = state
+            self.dirty = True
+        return state
+
+    def invalidate(self):
+        """
+        Drops all compiled states and forces the version to be re-read.
+        A rewrite within the same mtime tick and size would not show up in stat().
+        """
+        self.stat = None
+        self.version = None
+        self.guilds.clear()
+        self.dirty = True
+
+    def load_snapshot(self, path=SNAPSHOT_FILE):
+        self.guilds = load_snapshot(self.version, path)
+        self.dirty = False
+        return len(self.guilds)
+
+    def save_snapshot(self, path=SNAPSHOT_FILE):
+        """
+        Writes the snapshot only if something changed since the last write.
+        Returns True if the file was written.
+        """
+        if not self.dirty:
+            return False
+        save_snapshot(self.guilds, self.version, path)
+        self.dirty = False
+        return True
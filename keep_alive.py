@@ -13,5 +13,6 @@ def run():
     app.run(host='0.0.0.0', port=port)
 
 def keep_alive():
-    t = Thread(target=run)
+    # Daemon so the process can exit once the bot shuts down (e.g. on SIGTERM)
+    t = Thread(target=run, daemon=True)
     t.start()
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+# How often the loop heartbeat runs, and how late it may be before we complain.
+LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL_MS', '250')) / 1000
+LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD_MS', '500')) / 1000
+
+# Minimum gap between two stack snapshots so a long stall doesn't flood the logs.
+SNAPSHOT_COOLDOWN = 30.0
+
+
+def format_frame(frame):
+    """
+    Returns a one-line "file:function:line" label for a frame.
+    """
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def collapse_stack(frame):
+    """
+    Converts a frame into a collapsed-stack string (root first, ';' separated),
+    which is the input format used by flamegraph.pl / speedscope.
+    """
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag continuously.
+
+    A coroutine on the loop records a heartbeat every LAG_INTERVAL seconds and
+    measures how late it woke up. A separate thread watches that heartbeat:
+    if a beat is more than LAG_THRESHOLD overdue, the loop is blocked
+    right now, so the thread grabs the loop thread's stack and prints it.
+    """
+
+    def __init__(self, interval=LAG_INTERVAL, threshold=LAG_THRESHOLD, cooldown=SNAPSHOT_COOLDOWN):
+        self.interval = interval
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.loop_thread_id = None
+        self.last_beat = time.monotonic()
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.snapshots = 0
+        self._last_snapshot = 0.0
+        self._task = None
+        self._stop = threading.Event()
+
+    def start(self, loop=None):
+        if self._task is not None:
+            return
+        loop = loop or asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+        print(f"[INFO] Loop watchdog started (threshold: {int(self.threshold * 1000)}ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while not self._stop.is_set():
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.last_beat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                print(f"[WARN] Event loop lag: {int(lag * 1000)}ms")
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            # The heartbeat sleeps `interval` between beats, so only time past
+            # that counts as lag (same measure as _heartbeat)
+            lag = time.monotonic() - self.last_beat - self.interval
+            if lag <= self.threshold:
+                continue
+            if time.monotonic() - self._last_snapshot < self.cooldown:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self._last_snapshot = time.monotonic()
+            stack = "".join(traceback.format_stack(frame))
+            self.snapshots += 1
+            print(f"[WARN] Event loop blocked for {int(lag * 1000)}ms, stack snapshot:\n{stack}")
+
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler for a single thread (the event loop thread).
+    Samples the thread's current stack every `interval` seconds from a background
+    thread and counts identical collapsed stacks.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.total = 0
+
+    def sample_once(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        self.samples[collapse_stack(frame)] += 1
+        self.total += 1
+
+    def run(self, duration):
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self.sample_once()
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        """
+        Returns the samples as "stack count" lines, most frequent first.
+        """
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+async def profile_loop(duration, interval=0.005):
+    """
+    Profiles the running event loop for `duration` seconds.
+    Sampling runs in a worker thread, so the loop keeps serving events meanwhile.
+    """
+    profiler = SamplingProfiler(threading.get_ident(), interval)
+    await asyncio.to_thread(profiler.run, duration)
+    return profiler
@@ -0,0 +1,198 @@
+import sys
+from array import array
+
+MAX_NICK_LENGTH = 32
+
+
+def calculate_nickname(current_nick, target_tag, known_tags):
+    """
+    Strips every known tag from the nickname and appends the target tag,
+    truncating the name so the result fits in 32 characters.
+    `known_tags` must already be sorted longest first.
+    """
+    temp_nick = current_nick
+    for tag in known_tags:
+        if tag in temp_nick:
+            # Try removing " {tag}" (with space), then "{tag}" (no space)
+            new_val = temp_nick.replace(f" {tag}", "")
+            if new_val == temp_nick:
+                new_val = temp_nick.replace(tag, "")
+            temp_nick = new_val.strip()
+
+    if target_tag:
+        final_nick = f"{temp_nick} {target_tag}"
+    else:
+        final_nick = temp_nick
+
+    if len(final_nick) > MAX_NICK_LENGTH:
+        if target_tag:
+            allowed = MAX_NICK_LENGTH - len(target_tag) - 1
+            if allowed > 0:
+                final_nick = f"{temp_nick[:allowed].strip()} {target_tag}"
+            else:
+                final_nick = temp_nick[:MAX_NICK_LENGTH]
+        else:
+            final_nick = temp_nick[:MAX_NICK_LENGTH]
+    return final_nick
+
+
+def member_role_ids(member):
+    """
+    Returns a member's role ids without building Role objects.
+    discord.py keeps them in the private `_roles`; fall back to the public
+    `roles` list if that attribute is ever missing.
+    """
+    role_ids = getattr(member, '_roles', None)
+    if role_ids is None:
+        role_ids = [role.id for role in member.roles]
+    return role_ids
+
+
+class RoleIndex:
+    """
+    Orders a guild's configured roles by priority (highest position first).
+    Bit i of a member's role bitset means "has the i-th configured role",
+    so the lowest set bit is always the member's highest configured role.
+    """
+
+    __slots__ = ('role_ids', 'tags', 'bit_for_role', 'positions')
+
+    def __init__(self, roles_config, positions):
+        """
+        roles_config: {role_id_str: tag} from the compiled guild state.
+        positions: {role_id_int: position} for every role in the guild.
+        """
+        configured = [int(role_id) for role_id in roles_config if int(role_id) in positions]
+        configured.sort(key=lambda role_id: positions[role_id], reverse=True)
+
+        self.role_ids = configured
+        self.tags = [roles_config[str(role_id)] for role_id in configured]
+        self.bit_for_role = {role_id: 1 << i for i, role_id in enumerate(configured)}
+        self.positions = positions
+
+    @classmethod
+    def from_guild(cls, guild, roles_config):
+        return cls(roles_config, {role.id: role.position for role in guild.roles})
+
+    def bits_for(self, role_ids):
+        bits = 0
+        bit_for_role = self.bit_for_role
+        for role_id in role_ids:
+            bit = bit_for_role.get(role_id)
+            if bit:
+                bits |= bit
+        return bits
+
+    def top_position(self, role_ids):
+        positions = self.positions
+        return max((positions.get(role_id, 0) for role_id in role_ids), default=0)
+
+    def tag_for(self, bits):
+        if not bits:
+            return None
+        return self.tags[(bits & -bits).bit_length() - 1]
+
+
+class MemberTable:
+    """
+    Columnar snapshot of the member state a guild-wide sweep needs.
+    One row per member: id, top role position, configured-role bitset and
+    interned display name. Full discord.py Member objects are only looked up
+    for the rows that actually need an edit.
+    """
+
+    __slots__ = ('role_index', 'ids', 'top_positions', 'role_bits', 'names')
+
+    def __init__(self, role_index):
+        self.role_index = role_index
+        self.ids = array('Q')
+        self.top_positions = array('i')
+        # Bitsets are Python ints; small values (incl. 0) are shared objects
+        self.role_bits = []
+        self.names = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, member_id, role_ids, display_name):
+        self.ids.append(member_id)
+        self.top_positions.append(self.role_index.top_position(role_ids))
+        self.role_bits.append(self.role_index.bits_for(role_ids))
+        self.names.append(sys.intern(display_name))
+
+    def add_payload(self, payload):
+        """
+        Adds one member dict as sent in a GUILD_MEMBERS_CHUNK payload.
+        """
+        user = payload['user']
+        display_name = payload.get('nick') or user.get('global_name') or user['username']
+        self.add(int(user['id']), [int(role_id) for role_id in payload.get('roles', [])], display_name)
+
+    @classmethod
+    def from_payloads(cls, role_index, payloads):
+        """
+        Builds a table from raw GUILD_MEMBERS_CHUNK member dicts.
+        The bot itself uses from_members (discord.py already consumes the chunk
+        payloads); this is for payload-fed callers and the benchmark.
+        """
+        table = cls(role_index)
+        for payload in payloads:
+            table.add_payload(payload)
+        return table
+
+    @classmethod
+    def from_members(cls, role_index, members):
+        table = cls(role_index)
+        for member in members:
+            table.add(member.id, member_role_ids(member), member.display_name)
+        return table
+
+    def matches(self, row, member):
+        """
+        True if the live member still has the name and configured roles
+        this row was built from.
+        """
+        return (member.display_name == self.names[row]
+                and self.role_index.bits_for(member_role_ids(member)) == self.role_bits[row])
+
+
+def plan_nicknames(table, default_tag, known_tags):
+    """
+    Yields (row, final_nick) for every member whose nickname must change.
+    """
+    tag_for = table.role_index.tag_for
+    names = table.names
+    for row, bits in enumerate(table.role_bits):
+        target_tag = tag_for(bits) or default_tag
+        current_nick = names[row]
+        final_nick = calculate_nickname(current_nick, target_tag, known_tags)
+        if final_nick != current_nick:
+            yield row, final_nick
+
+
+def plan_member(role_index, member, default_tag, known_tags):
+    """
+    Plans one live member (used when a row went stale during a sweep).
+    Returns the new nickname, or None if it is already correct.
+    """
+    target_tag = role_index.tag_for(role_index.bits_for(member_role_ids(member))) or default_tag
+    final_nick = calculate_nickname(member.display_name, target_tag, known_tags)
+    if final_nick == member.display_name:
+        return None
+    return final_nick
+
+
+def reconcile(table, plan, owner_id, bot_top_position):
+    """
+    Filters a plan down to edits the bot is allowed to make.
+    Yields (row, final_nick); skips the owner and members whose
+    top role is not below the bot's.
+    """
+    ids = table.ids
+    top_positions = table.top_positions
+    for row, final_nick in plan:
+        if ids[row] == owner_id:
+            continue
+        if top_positions[row] >= bot_top_position:
+            continue
+        yield row, final_nick
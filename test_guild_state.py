@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from guild_state import GuildStateCache, compile_guild_state, config_version, load_snapshot, save_snapshot
+
+
+class TestGuildState(unittest.TestCase):
+    def test_compile_known_tags(self):
+        state = compile_guild_state({"default_tag": "[Member]", "roles": {"1": "[Mod]", "2": "[Admin]"}})
+        self.assertEqual(state["default_tag"], "[Member]")
+        self.assertEqual(state["roles"], {"1": "[Mod]", "2": "[Admin]"})
+        for tag in ["[Mod]", "[Admin]", "[Member]", "[MSUAN]"]:
+            self.assertIn(tag, state["known_tags"])
+        # Longest first
+        lengths = [len(t) for t in state["known_tags"]]
+        self.assertEqual(lengths, sorted(lengths, reverse=True))
+
+    def test_compile_empty_config(self):
+        state = compile_guild_state({})
+        self.assertIsNone(state["default_tag"])
+        self.assertEqual(state["roles"], {})
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config_file = os.path.join(tmp, 'role_tags.json')
+            with open(config_file, 'w') as f:
+                f.write('{"1": {"default_tag": "[M]", "roles": {}}}')
+            version = config_version(config_file)
+            path = os.path.join(tmp, 'snapshot.json')
+            states = {"1": compile_guild_state({"default_tag": "[M]", "roles": {}})}
+
+            save_snapshot(states, version, path)
+            self.assertEqual(load_snapshot(version, path), states)
+
+            # Config changed -> snapshot is stale
+            with open(config_file, 'w') as f:
+                f.write('{}')
+            self.assertEqual(load_snapshot(config_version(config_file), path), {})
+
+    def test_missing_or_corrupt_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snapshot.json')
+            self.assertEqual(load_snapshot("v", path), {})
+            with open(path, 'w') as f:
+                f.write('not json')
+            self.assertEqual(load_snapshot("v", path), {})
+
+
+class TestGuildStateCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.tmp.name, 'role_tags.json')
+        self.write_config({"1": {"default_tag": "[A]", "roles": {}}})
+        self.cache = GuildStateCache(self.config_file)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_config(self, config):
+        with open(self.config_file, 'w') as f:
+            json.dump(config, f)
+
+    def test_serves_from_cache_while_unchanged(self):
+        first = self.cache.get(1)
+        with mock.patch('guild_state.compile_guild_state') as compile_mock:
+            self.assertIs(self.cache.get(1), first)
+            compile_mock.assert_not_called()
+
+    def test_recompiles_after_external_change(self):
+        self.assertEqual(self.cache.get(1)["default_tag"], "[A]")
+        self.write_config({"1": {"default_tag": "[Longer]", "roles": {}}})
+        self.assertEqual(self.cache.get(1)["default_tag"], "[Longer]")
+
+    def test_touch_without_content_change_keeps_cache(self):
+        first = self.cache.get(1)
+        self.write_config({"1": {"default_tag": "[A]", "roles": {}}})
+        os.utime(self.config_file, ns=(0, 0))
+        self.assertIs(self.cache.get(1), first)
+
+    def test_invalidate_after_write(self):
+        self.assertEqual(self.cache.get(1)["default_tag"], "[A]")
+        # Same size and forced same mtime: only invalidate() can notice this
+        stat = os.stat(self.config_file)
+        self.write_config({"1": {"default_tag": "[B]", "roles": {}}})
+        os.utime(self.config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.cache.get(1)["default_tag"], "[A]")
+
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get(1)["default_tag"], "[B]")
+
+    def test_unknown_guild_and_missing_file(self):
+        self.assertIsNone(self.cache.get(2)["default_tag"])
+        os.remove(self.config_file)
+        self.assertEqual(self.cache.get(1)["roles"], {})
+
+    def test_snapshot_round_trip(self):
+        self.cache.get(1)
+        path = os.path.join(self.tmp.name, 'snapshot.json')
+        self.cache.save_snapshot(path)
+
+        warm = GuildStateCache(self.config_file)
+        self.assertEqual(warm.load_snapshot(path), 1)
+        with mock.patch('guild_state.compile_guild_state') as compile_mock:
+            self.assertEqual(warm.get(1)["default_tag"], "[A]")
+            compile_mock.assert_not_called()
+
+    def test_snapshot_written_only_when_dirty(self):
+        path = os.path.join(self.tmp.name, 'snapshot.json')
+        self.assertFalse(self.cache.save_snapshot(path))
+        self.assertFalse(os.path.exists(path))
+
+        self.cache.get(1)
+        self.assertTrue(self.cache.save_snapshot(path))
+        # Served from cache: nothing new to write
+        self.cache.get(1)
+        self.assertFalse(self.cache.save_snapshot(path))
+
+        self.cache.invalidate()
+        self.assertTrue(self.cache.save_snapshot(path))
+
+    def test_snapshot_discarded_when_code_changes(self):
+        self.cache.get(1)
+        path = os.path.join(self.tmp.name, 'snapshot.json')
+        self.cache.save_snapshot(path)
+
+        with mock.patch('guild_state.LEGACY_DEFAULT_TAGS', ["[New]"]):
+            warm = GuildStateCache(self.config_file)
+            self.assertEqual(warm.load_snapshot(path), 0)
+            self.assertIn("[New]", warm.get(1)["known_tags"])
+
+
+if __name__ == '__main__':
+    unittest.main()
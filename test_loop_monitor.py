@@ -0,0 +1,104 @@
+import asyncio
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from loop_monitor import LoopWatchdog, SamplingProfiler, collapse_stack
+
+
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+class TestLoopMonitor(unittest.TestCase):
+    def test_collapse_stack_root_first(self):
+        def inner():
+            import sys
+            return collapse_stack(sys._getframe())
+
+        stack = inner()
+        parts = stack.split(";")
+        self.assertTrue(parts[-1].endswith(":inner"))
+        self.assertIn("test_loop_monitor.py:test_collapse_stack_root_first", stack)
+
+    def test_profiler_samples_busy_thread(self):
+        stop = threading.Event()
+
+        def busy_worker():
+            while not stop.is_set():
+                sum(range(1000))
+
+        worker = threading.Thread(target=busy_worker)
+        worker.start()
+        try:
+            profiler = SamplingProfiler(worker.ident, interval=0.001)
+            profiler.run(0.1)
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(profiler.total, 0)
+        output = profiler.collapsed()
+        self.assertIn("busy_worker", output)
+        # Every line is "<stack> <count>"
+        for line in output.strip().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(count.isdigit())
+
+    def test_empty_profile(self):
+        profiler = SamplingProfiler(thread_id=-1)
+        profiler.sample_once()
+        self.assertEqual(profiler.total, 0)
+        self.assertEqual(profiler.collapsed(), "")
+
+
+class TestLoopWatchdog(unittest.TestCase):
+    def run_with_blocks(self, *blocks):
+        watchdog = LoopWatchdog(interval=0.05, threshold=0.2)
+
+        async def scenario():
+            watchdog.start()
+            await asyncio.sleep(0.15)
+            for seconds in blocks:
+                blocking_call(seconds)
+                await asyncio.sleep(0.15)
+            watchdog.stop()
+
+        asyncio.run(scenario())
+        return watchdog
+
+    def test_block_past_threshold_takes_one_snapshot(self):
+        # Second block falls inside the snapshot cooldown
+        watchdog = self.run_with_blocks(0.5, 0.5)
+        self.assertEqual(watchdog.snapshots, 1)
+        self.assertGreaterEqual(watchdog.stalls, 1)
+        self.assertGreater(watchdog.max_lag, 0.2)
+
+    def test_block_below_threshold_is_ignored(self):
+        watchdog = self.run_with_blocks(0.1)
+        self.assertEqual(watchdog.snapshots, 0)
+        self.assertEqual(watchdog.stalls, 0)
+        self.assertLess(watchdog.max_lag, 0.2)
+
+    def test_snapshot_captures_blocking_stack(self):
+        watchdog = LoopWatchdog(interval=0.05, threshold=0.2)
+
+        async def scenario():
+            watchdog.start()
+            await asyncio.sleep(0.1)
+            blocking_call(0.5)
+            watchdog.stop()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            asyncio.run(scenario())
+
+        snapshots = output.getvalue().split("[WARN] Event loop blocked")[1:]
+        self.assertEqual(len(snapshots), 1)
+        self.assertIn("blocking_call", snapshots[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
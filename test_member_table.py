@@ -0,0 +1,84 @@
+import unittest
+from types import SimpleNamespace
+
+from member_table import (MemberTable, RoleIndex, calculate_nickname, member_role_ids,
+                          plan_member, plan_nicknames, reconcile)
+
+ROLES_CONFIG = {"10": "[Mod]", "20": "[Admin]"}
+POSITIONS = {10: 5, 20: 9, 30: 7, 99: 50}
+KNOWN_TAGS = ["[Member]", "[Admin]", "[Mod]"]
+
+
+def payload(member_id, username, roles, nick=None):
+    return {"user": {"id": str(member_id), "username": username}, "nick": nick, "roles": [str(r) for r in roles]}
+
+
+class TestMemberTable(unittest.TestCase):
+    def setUp(self):
+        self.index = RoleIndex(ROLES_CONFIG, POSITIONS)
+
+    def test_role_index_priority(self):
+        # Admin (position 9) outranks Mod (position 5)
+        self.assertEqual(self.index.tags, ["[Admin]", "[Mod]"])
+        self.assertEqual(self.index.tag_for(self.index.bits_for([10, 20, 30])), "[Admin]")
+        self.assertEqual(self.index.tag_for(self.index.bits_for([10, 30])), "[Mod]")
+        self.assertIsNone(self.index.tag_for(self.index.bits_for([30])))
+
+    def test_unknown_configured_role_is_ignored(self):
+        index = RoleIndex({"10": "[Mod]", "404": "[Gone]"}, POSITIONS)
+        self.assertEqual(index.tags, ["[Mod]"])
+
+    def test_table_from_payloads(self):
+        table = MemberTable.from_payloads(self.index, [
+            payload(1, "alice", [10], nick="Alice [Mod]"),
+            payload(2, "bob", [30]),
+        ])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table.ids), [1, 2])
+        self.assertEqual(list(table.top_positions), [5, 7])
+        self.assertEqual(table.names, ["Alice [Mod]", "bob"])
+
+    def test_plan_and_reconcile(self):
+        table = MemberTable.from_payloads(self.index, [
+            payload(1, "alice", [10], nick="Alice [Mod]"),      # already correct
+            payload(2, "bob", [10, 20], nick="Bob [Mod]"),      # promoted
+            payload(3, "carol", []),                            # gets default
+            payload(4, "owner", []),                            # guild owner
+            payload(5, "boss", [99]),                           # above the bot
+        ])
+        plan = list(plan_nicknames(table, "[Member]", KNOWN_TAGS))
+        self.assertEqual(plan, [(1, "Bob [Admin]"), (2, "carol [Member]"), (3, "owner [Member]"), (4, "boss [Member]")])
+
+        edits = list(reconcile(table, plan, owner_id=4, bot_top_position=20))
+        self.assertEqual(edits, [(1, "Bob [Admin]"), (2, "carol [Member]")])
+
+    def test_from_members_and_role_fallback(self):
+        with_private = SimpleNamespace(id=1, _roles=[20], display_name="Alice")
+        public_only = SimpleNamespace(id=2, roles=[SimpleNamespace(id=10)], display_name="Bob")
+        self.assertEqual(list(member_role_ids(public_only)), [10])
+
+        table = MemberTable.from_members(self.index, [with_private, public_only])
+        self.assertEqual([self.index.tag_for(bits) for bits in table.role_bits], ["[Admin]", "[Mod]"])
+
+    def test_stale_row_is_replanned_from_live_member(self):
+        member = SimpleNamespace(id=1, _roles=[10], display_name="Alice")
+        table = MemberTable.from_members(self.index, [member])
+        self.assertTrue(table.matches(0, member))
+
+        # Renamed during the sweep
+        member.display_name = "Alicia [Mod]"
+        self.assertFalse(table.matches(0, member))
+        self.assertIsNone(plan_member(self.index, member, "[Member]", KNOWN_TAGS))
+
+        # Promoted during the sweep
+        member._roles = [10, 20]
+        self.assertFalse(table.matches(0, member))
+        self.assertEqual(plan_member(self.index, member, "[Member]", KNOWN_TAGS), "Alicia [Admin]")
+
+    def test_calculate_nickname_length(self):
+        result = calculate_nickname("A" * 30, "[Tag]", ["[Tag]"])
+        self.assertEqual(result, "A" * 26 + " [Tag]")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,44 +1,11 @@
-
 import unittest
 
+from member_table import calculate_nickname
+
 class TestNicknameLogic(unittest.TestCase):
     def calculate_nickname(self, current_nick, target_tag, all_known_tags):
-        # Logic from bot.py
-        temp_nick = current_nick
-        
-        # Sort by length descending to avoid partial replacements
-        all_known_tags.sort(key=len, reverse=True)
-        
-        for tag in all_known_tags:
-            if tag in temp_nick:
-                # Try removing " {tag}" (with space)
-                new_val = temp_nick.replace(f" {tag}", "")
-                if new_val == temp_nick:
-                    # Try removing "{tag}" (no space)
-                    new_val = temp_nick.replace(tag, "")
-                temp_nick = new_val.strip()
-                
-        # Now temp_nick should be just the username without any known tags
-        
-        # --- 3. Append Target Tag ---
-        if target_tag:
-            final_nick = f"{temp_nick} {target_tag}"
-        else:
-            final_nick = temp_nick
-
-        # --- 4. Length Check (32 chars max) ---
-        if len(final_nick) > 32:
-            if target_tag:
-                # Truncate name to fit tag
-                allowed_len = 32 - len(target_tag) - 1 # -1 for space
-                if allowed_len > 0:
-                    final_nick = f"{temp_nick[:allowed_len].strip()} {target_tag}"
-                else:
-                    final_nick = temp_nick[:32] # Fallback
-            else:
-                final_nick = temp_nick[:32]
-        
-        return final_nick
+        # bot.py passes the compiled known-tag list, sorted longest first
+        return calculate_nickname(current_nick, target_tag, sorted(all_known_tags, key=len, reverse=True))
 
     def test_basic_enforcement(self):
         # User manually removes tag